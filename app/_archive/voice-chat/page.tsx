@@ -63,6 +63,8 @@ export default function VoiceChatPage() {
   const wsRef = useRef<WebSocket | null>(null);
   const recognitionRef = useRef<SpeechRecognition | null>(null);
   const audioContextRef = useRef<AudioContext | null>(null);
+  const nextPlayTimeRef = useRef(0);
+  const audioSampleRateRef = useRef(24000);
 
   // Initialize Web Speech Recognition
   const initSpeechRecognition = () => {
@@ -126,6 +128,7 @@ export default function VoiceChatPage() {
 
       // Connect to WebSocket server
       const ws = new WebSocket("ws://localhost:8000/ws");
+      ws.binaryType = "arraybuffer";
 
       ws.onopen = () => {
         console.log("WebSocket connected");
@@ -137,15 +140,20 @@ export default function VoiceChatPage() {
       ws.onmessage = async (event) => {
         console.log("Received message from server");
 
+        // Binary frames are raw PCM audio streamed as it is synthesized
+        if (event.data instanceof ArrayBuffer) {
+          playAudioData(new Uint8Array(event.data));
+          return;
+        }
+
         const message = JSON.parse(event.data);
 
         if (message.type === "response") {
           setResponse(message.text);
           setStatus("Assistant responded");
-        } else if (message.type === "audio") {
-          // Convert hex string back to audio bytes
-          const audioBytes = hexToBytes(message.data);
-          await playAudioData(audioBytes);
+        } else if (message.type === "audio_header") {
+          // Describes the binary audio frames that follow
+          audioSampleRateRef.current = message.sample_rate;
         } else if (message.type === "error") {
           setStatus(`Error: ${message.message}`);
         }
@@ -180,15 +188,6 @@ export default function VoiceChatPage() {
     }
   };
 
-  // Convert hex string to Uint8Array
-  const hexToBytes = (hex: string): Uint8Array => {
-    const bytes = new Uint8Array(hex.length / 2);
-    for (let i = 0; i < hex.length; i += 2) {
-      bytes[i / 2] = parseInt(hex.substr(i, 2), 16);
-    }
-    return bytes;
-  };
-
   // Start listening
   const startListening = () => {
     if (!recognitionRef.current) {
@@ -226,11 +225,11 @@ export default function VoiceChatPage() {
       const audioBuffer = audioContextRef.current.createBuffer(
         1, // mono
         audioBytes.length / 2, // 16-bit samples
-        24000 // sample rate
+        audioSampleRateRef.current // sample rate
       );
 
       const channelData = audioBuffer.getChannelData(0);
-      const dataView = new DataView(audioBytes.buffer);
+      const dataView = new DataView(audioBytes.buffer, audioBytes.byteOffset, audioBytes.byteLength);
 
       for (let i = 0; i < audioBytes.length / 2; i++) {
         // Convert 16-bit PCM to float
@@ -238,10 +237,14 @@ export default function VoiceChatPage() {
         channelData[i] = sample;
       }
 
+      // Queue chunks back to back so streamed audio plays gaplessly
+      const startTime = Math.max(audioContextRef.current.currentTime, nextPlayTimeRef.current);
+      nextPlayTimeRef.current = startTime + audioBuffer.duration;
+
       const source = audioContextRef.current.createBufferSource();
       source.buffer = audioBuffer;
       source.connect(audioContextRef.current.destination);
-      source.start();
+      source.start(startTime);
     } catch (error) {
       console.error("Error playing audio:", error);
     }
@@ -259,6 +262,7 @@ export default function VoiceChatPage() {
     if (audioContextRef.current) {
       audioContextRef.current.close();
       audioContextRef.current = null;
+      nextPlayTimeRef.current = 0;
     }
 
     setIsConnected(false);
@@ -133,7 +133,7 @@ export default function TestPage() {
     const wsUrl = process.env.NEXT_PUBLIC_VOICE_AGENT_URL || "ws://localhost:8000";
 
     try {
-      const ws = new WebSocket(`${wsUrl}?sessionId=test&userId=test`);
+      const ws = new WebSocket(`${wsUrl}?sessionId=test_${Date.now()}&userId=test`);
 
       const timeout = setTimeout(() => {
         ws.close();
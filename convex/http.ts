@@ -5,6 +5,9 @@ import { v } from "convex/values";
 
 const http = httpRouter();
 
+// Upper bound on turns accepted by the batch logging endpoint
+const MAX_LOG_BATCH_SIZE = 100;
+
 /**
  * HTTP endpoint for Pipecat server to log conversation turns
  * This allows the Python Pipecat agent to persist conversation data to Convex
@@ -114,6 +117,105 @@ http.route({
   }),
 });
 
+/**
+ * HTTP endpoint for Pipecat server to log a batch of conversation turns
+ * The Python agent buffers turns and flushes them here in a single request
+ */
+http.route({
+  path: "/pipecat/log-conversation-batch",
+  method: "POST",
+  handler: httpAction(async (ctx, request) => {
+    // Implement custom authorization for Pipecat server
+    const secretHeader = request.headers.get("X-Pipecat-Secret");
+    const expectedSecret = process.env.PIPECAT_SERVER_SECRET;
+
+    if (!expectedSecret) {
+      console.error("[HTTP] PIPECAT_SERVER_SECRET not configured");
+      return new Response(
+        JSON.stringify({ error: "Server configuration error" }),
+        {
+          status: 500,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    }
+
+    if (secretHeader !== expectedSecret) {
+      console.warn("[HTTP] Unauthorized request to log-conversation-batch endpoint");
+      return new Response(JSON.stringify({ error: "Unauthorized" }), {
+        status: 401,
+        headers: { "Content-Type": "application/json" },
+      });
+    }
+
+    try {
+      const body = await request.json();
+      const { entries } = body;
+
+      // Validate incoming data
+      if (!Array.isArray(entries) || entries.length === 0 || entries.length > MAX_LOG_BATCH_SIZE) {
+        return new Response(
+          JSON.stringify({ error: "Invalid entries" }),
+          {
+            status: 400,
+            headers: { "Content-Type": "application/json" },
+          }
+        );
+      }
+
+      for (const entry of entries) {
+        if (
+          !entry ||
+          !entry.sessionId || typeof entry.sessionId !== "string" ||
+          !entry.speaker || typeof entry.speaker !== "string" ||
+          !entry.text || typeof entry.text !== "string" ||
+          !entry.timestamp || typeof entry.timestamp !== "number"
+        ) {
+          return new Response(
+            JSON.stringify({ error: "Invalid entry" }),
+            {
+              status: 400,
+              headers: { "Content-Type": "application/json" },
+            }
+          );
+        }
+      }
+
+      // Call internal mutation to store all turns in one transaction
+      await ctx.runMutation(internal.voiceShopper.logConversationTurns, {
+        entries: entries.map(({ sessionId, speaker, text, timestamp }) => ({
+          sessionId,
+          speaker,
+          text,
+          timestamp,
+        })),
+      });
+
+      console.log(`[HTTP] Logged ${entries.length} conversation turns`);
+
+      return new Response(
+        JSON.stringify({ success: true, count: entries.length }),
+        {
+          status: 200,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    } catch (error) {
+      console.error("[HTTP] Error logging conversation batch:", error);
+      return new Response(
+        JSON.stringify({
+          error: "Internal server error",
+          message: error instanceof Error ? error.message : "Unknown error",
+        }),
+        {
+          status: 500,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    }
+  }),
+});
+
 /**
  * HTTP endpoint for Pipecat server to trigger background research
  * This allows the Python agent to initiate product searches
@@ -240,6 +342,91 @@ http.route({
   }),
 });
 
+/**
+ * HTTP endpoint for Pipecat server to fetch a user's shopping preferences
+ * Used by the agent's get_user_preferences tool to personalize responses
+ */
+http.route({
+  path: "/pipecat/user-preferences",
+  method: "POST",
+  handler: httpAction(async (ctx, request) => {
+    // Implement custom authorization for Pipecat server
+    const secretHeader = request.headers.get("X-Pipecat-Secret");
+    const expectedSecret = process.env.PIPECAT_SERVER_SECRET;
+
+    if (!expectedSecret) {
+      console.error("[HTTP] PIPECAT_SERVER_SECRET not configured");
+      return new Response(
+        JSON.stringify({ error: "Server configuration error" }),
+        {
+          status: 500,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    }
+
+    if (secretHeader !== expectedSecret) {
+      console.warn("[HTTP] Unauthorized request to user-preferences endpoint");
+      return new Response(JSON.stringify({ error: "Unauthorized" }), {
+        status: 401,
+        headers: { "Content-Type": "application/json" },
+      });
+    }
+
+    try {
+      const body = await request.json();
+      const { userId } = body;
+
+      if (!userId || typeof userId !== "string") {
+        return new Response(
+          JSON.stringify({ error: "Invalid userId" }),
+          {
+            status: 400,
+            headers: { "Content-Type": "application/json" },
+          }
+        );
+      }
+
+      const preferences = await ctx.runQuery(
+        internal.userPreferences.getPreferencesByClerkIdInternal,
+        { clerkUserId: userId }
+      );
+
+      return new Response(
+        JSON.stringify({
+          success: true,
+          preferences: preferences
+            ? {
+                style: preferences.style,
+                budget: preferences.budget,
+                size: preferences.size,
+                productCategories: preferences.productCategories,
+                brands: preferences.brands,
+                colors: preferences.colors,
+              }
+            : null,
+        }),
+        {
+          status: 200,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    } catch (error) {
+      console.error("[HTTP] Error fetching user preferences:", error);
+      return new Response(
+        JSON.stringify({
+          error: "Internal server error",
+          message: error instanceof Error ? error.message : "Unknown error",
+        }),
+        {
+          status: 500,
+          headers: { "Content-Type": "application/json" },
+        }
+      );
+    }
+  }),
+});
+
 /**
  * Health check endpoint for monitoring
  */
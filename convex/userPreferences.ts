@@ -1,4 +1,4 @@
-import { query, mutation, internalMutation } from "./_generated/server";
+import { query, mutation, internalMutation, internalQuery } from "./_generated/server";
 import { v } from "convex/values";
 
 /**
@@ -47,6 +47,28 @@ export const getPreferencesByUserId = query({
   },
 });
 
+/**
+ * Get preferences for a user by Clerk user ID (used by HTTP endpoints)
+ */
+export const getPreferencesByClerkIdInternal = internalQuery({
+  args: { clerkUserId: v.string() },
+  handler: async (ctx, args) => {
+    const user = await ctx.db
+      .query("preference_users")
+      .withIndex("by_clerk_user_id", (q) => q.eq("clerkUserId", args.clerkUserId))
+      .unique();
+
+    if (!user) {
+      return null;
+    }
+
+    return await ctx.db
+      .query("user_preferences")
+      .withIndex("by_user_id", (q) => q.eq("userId", user._id))
+      .unique();
+  },
+});
+
 /**
  * Update user preferences (partial update)
  * Users can manually edit their preferences through the UI
@@ -272,6 +272,32 @@ export const logConversationTurn = internalMutation({
   },
 });
 
+/**
+ * Internal mutation to log a batch of conversation turns (called by httpAction from Pipecat server)
+ */
+export const logConversationTurns = internalMutation({
+  args: {
+    entries: v.array(
+      v.object({
+        sessionId: v.string(),
+        speaker: v.string(),
+        text: v.string(),
+        timestamp: v.number(),
+      })
+    ),
+  },
+  handler: async (ctx, args) => {
+    for (const entry of args.entries) {
+      await ctx.db.insert("conversation_logs", {
+        sessionId: entry.sessionId,
+        speaker: entry.speaker,
+        text: entry.text,
+        timestamp: entry.timestamp,
+      });
+    }
+  },
+});
+
 /**
  * Get conversation history for a session
  */
@@ -3,12 +3,161 @@ Custom actions for the Voice Shopper agent
 These actions can be invoked by the LLM during conversations
 """
 
+import time
+import secrets
 import httpx
+import orjson
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Final, List, Optional
+
+from cachetools import TTLCache
+
+if TYPE_CHECKING:
+    from pipecat.services.llm_service import FunctionCallParams
 
 logger = logging.getLogger(__name__)
 
+# User preferences are cached for this many seconds
+PREFERENCE_CACHE_TTL = 300
+PREFERENCE_CACHE_SIZE = 4096
+
+# Conversation logs are flushed when this many are queued, or after this many seconds
+LOG_BATCH_SIZE = 32
+LOG_FLUSH_INTERVAL = 0.2
+
+# Most log entries held while Convex is slow or down; newer entries are dropped past this
+LOG_QUEUE_SIZE = 1024
+
+# OpenAI-format tool definitions, built once and shared by every session
+_TOOL_DEFINITIONS: Final[List[Dict[str, Any]]] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_products",
+            "description": "Search for products based on user's query and preferences. Use this when the user asks to find, search for, or show them products.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "The search query for products (e.g., 'laptop for programming', 'ergonomic office chair')"
+                    },
+                    "min_price": {
+                        "type": "number",
+                        "description": "Minimum price in USD (optional)"
+                    },
+                    "max_price": {
+                        "type": "number",
+                        "description": "Maximum price in USD (optional)"
+                    },
+                    "brands": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Preferred brands (optional)"
+                    },
+                    "categories": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Product categories (optional)"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "save_item",
+            "description": "Save a product to the user's saved items list. Use this when the user asks to save, remember, or add a product to their list.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "product_id": {
+                        "type": "string",
+                        "description": "Unique identifier for the product"
+                    },
+                    "product_name": {
+                        "type": "string",
+                        "description": "Name of the product"
+                    },
+                    "description": {
+                        "type": "string",
+                        "description": "Product description (optional)"
+                    },
+                    "price": {
+                        "type": "number",
+                        "description": "Product price (optional)"
+                    }
+                },
+                "required": ["product_id", "product_name"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_user_preferences",
+            "description": "Get the user's saved shopping preferences. Use this to personalize recommendations.",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    }
+]
+
+
+def now_ms() -> int:
+    """Current Unix time in integer milliseconds"""
+    return time.time_ns() // 1_000_000
+
+
+def new_id(prefix: str) -> str:
+    """
+    Generate a unique identifier, e.g. for a session
+
+    Does not need a running event loop, and the random suffix keeps IDs
+    minted in the same clock tick from colliding.
+
+    Args:
+        prefix: Identifier prefix (e.g. "session")
+
+    Returns:
+        Identifier string
+    """
+    return f"{prefix}_{time.monotonic_ns():x}_{secrets.token_hex(3)}"
+
+
+async def invoke_tool(
+    handler: Callable[..., Awaitable[Dict[str, Any]]],
+    session_scoped: bool,
+    session_id: str,
+    user_id: str,
+    params: "FunctionCallParams",
+) -> None:
+    """
+    Run an action for an LLM function call and report its result
+
+    Bind everything but params with functools.partial to get a Pipecat
+    function call handler.
+
+    Args:
+        handler: Action method from VoiceShopperActions.tool_handlers
+        session_scoped: Whether the action takes session_id as well as user_id
+        session_id: Voice session identifier
+        user_id: User identifier
+        params: Pipecat FunctionCallParams for the call
+    """
+    if session_scoped:
+        result = await handler(session_id, user_id, **params.arguments)
+    else:
+        result = await handler(user_id, **params.arguments)
+    await params.result_callback(result)
+
 
 class VoiceShopperActions:
     """
@@ -25,93 +174,66 @@ class VoiceShopperActions:
         """
         self.convex_url = convex_url.rstrip("/")
         self.secret = secret
-        self.client = httpx.AsyncClient(timeout=30.0)
+
+        # Headers sent with every Convex request
+        self._headers = {
+            "X-Pipecat-Secret": self.secret,
+            "Content-Type": "application/json",
+            "Accept-Encoding": "br, gzip",
+        }
+        # One long-lived HTTP/2 client so log and search calls multiplex over
+        # a single warm connection instead of paying a handshake each time
+        # (pool settings go on the transport; httpx ignores client-level
+        # limits and http2 once a transport is given)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=2.0),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=1,
+                limits=httpx.Limits(
+                    max_keepalive_connections=32,
+                    max_connections=64,
+                    keepalive_expiry=300.0,
+                ),
+            ),
+        )
+
+        # Cached preferences and per-user locks so concurrent misses fetch
+        # once; each lock is kept as [lock, callers holding or waiting on it]
+        self._pref_cache: TTLCache = TTLCache(maxsize=PREFERENCE_CACHE_SIZE, ttl=PREFERENCE_CACHE_TTL)
+        self._pref_locks: Dict[str, List[Any]] = {}
+
+        # Conversation logs waiting to be flushed by the worker that running() owns
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+
+        # (tool name, action, takes session_id) for registering with the LLM
+        self.tool_handlers = (
+            ("search_products", self.search_products, True),
+            ("save_item", self.save_item, True),
+            ("get_user_preferences", self.get_user_preferences, False),
+        )
+
+    async def warmup(self) -> None:
+        """
+        Open the connection to Convex ahead of the first real request
+
+        Failures are logged and ignored; the first action will simply pay
+        the connection cost instead.
+        """
+        try:
+            await self.client.head(self.convex_url)
+            logger.info("[Action] Convex connection warmed up")
+        except Exception as e:
+            logger.warning(f"[Action] Failed to warm up Convex connection: {e}")
 
     def get_tool_definitions(self) -> List[Dict[str, Any]]:
         """
         Get OpenAI function calling tool definitions for the LLM
 
         Returns:
-            List of tool definitions in OpenAI format
+            List of tool definitions in OpenAI format (shared; do not mutate)
         """
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": "search_products",
-                    "description": "Search for products based on user's query and preferences. Use this when the user asks to find, search for, or show them products.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "The search query for products (e.g., 'laptop for programming', 'ergonomic office chair')"
-                            },
-                            "min_price": {
-                                "type": "number",
-                                "description": "Minimum price in USD (optional)"
-                            },
-                            "max_price": {
-                                "type": "number",
-                                "description": "Maximum price in USD (optional)"
-                            },
-                            "brands": {
-                                "type": "array",
-                                "items": {"type": "string"},
-                                "description": "Preferred brands (optional)"
-                            },
-                            "categories": {
-                                "type": "array",
-                                "items": {"type": "string"},
-                                "description": "Product categories (optional)"
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "save_item",
-                    "description": "Save a product to the user's saved items list. Use this when the user asks to save, remember, or add a product to their list.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "product_id": {
-                                "type": "string",
-                                "description": "Unique identifier for the product"
-                            },
-                            "product_name": {
-                                "type": "string",
-                                "description": "Name of the product"
-                            },
-                            "description": {
-                                "type": "string",
-                                "description": "Product description (optional)"
-                            },
-                            "price": {
-                                "type": "number",
-                                "description": "Product price (optional)"
-                            }
-                        },
-                        "required": ["product_id", "product_name"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_user_preferences",
-                    "description": "Get the user's saved shopping preferences. Use this to personalize recommendations.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": []
-                    }
-                }
-            }
-        ]
+        return _TOOL_DEFINITIONS
 
     async def search_products(
         self,
@@ -155,20 +277,17 @@ class VoiceShopperActions:
             # Call Convex HTTP endpoint to trigger research
             response = await self.client.post(
                 f"{self.convex_url}/pipecat/trigger-research",
-                json={
+                content=orjson.dumps({
                     "query": query,
                     "sessionId": session_id,
                     "userId": user_id,
                     "preferences": preferences if preferences else None,
-                },
-                headers={
-                    "X-Pipecat-Secret": self.secret,
-                    "Content-Type": "application/json",
-                }
+                }),
+                headers=self._headers,
             )
 
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
 
             logger.info(f"[Action] Search completed: {result.get('resultsCount', 0)} products found")
 
@@ -177,7 +296,7 @@ class VoiceShopperActions:
                 session_id=session_id,
                 speaker="system",
                 text=f"Searched for: {query}",
-                timestamp=int(httpx.codes.FOUND * 1000)  # Current timestamp
+                timestamp=now_ms()
             )
 
             return {
@@ -230,7 +349,7 @@ class VoiceShopperActions:
                 session_id=session_id,
                 speaker="system",
                 text=f"Saved item: {product_name}",
-                timestamp=int(httpx.codes.FOUND * 1000)
+                timestamp=now_ms()
             )
 
             return {
@@ -249,6 +368,10 @@ class VoiceShopperActions:
         """
         Get user's shopping preferences
 
+        Preferences change on human timescales, so results are cached per
+        user for PREFERENCE_CACHE_TTL seconds. Concurrent misses for the same
+        user share a single Convex request.
+
         Args:
             user_id: User identifier
 
@@ -257,17 +380,27 @@ class VoiceShopperActions:
         """
         logger.info(f"[Action] Getting preferences for user {user_id}")
 
+        if (cached := self._pref_cache.get(user_id)) is not None:
+            return cached
+
+        # Callers holding or waiting on a user's lock keep it registered, so
+        # a caller arriving mid-fetch always queues behind the same lock
+        lock_entry = self._pref_locks.get(user_id)
+        if lock_entry is None:
+            lock_entry = self._pref_locks[user_id] = [asyncio.Lock(), 0]
+        lock_entry[1] += 1
+
         try:
-            # In a full implementation, this would query Convex
-            # For now, return a placeholder response
-            return {
-                "success": True,
-                "preferences": {
-                    "style": ["modern", "minimalist"],
-                    "budget": {"min": 50, "max": 500},
-                    "brands": ["Apple", "Dell", "Herman Miller"]
+            async with lock_entry[0]:
+                if (cached := self._pref_cache.get(user_id)) is not None:
+                    return cached
+
+                result = {
+                    "success": True,
+                    "preferences": await self._fetch_preferences(user_id),
                 }
-            }
+                self._pref_cache[user_id] = result
+                return result
 
         except Exception as e:
             logger.error(f"[Action] Error getting preferences: {e}")
@@ -276,6 +409,30 @@ class VoiceShopperActions:
                 "message": f"Could not retrieve preferences: {str(e)}"
             }
 
+        finally:
+            lock_entry[1] -= 1
+            if not lock_entry[1]:
+                del self._pref_locks[user_id]
+
+    async def _fetch_preferences(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a user's preferences from Convex
+
+        Args:
+            user_id: User identifier
+
+        Returns:
+            Preferences, or None if the user has none saved
+        """
+        response = await self.client.post(
+            f"{self.convex_url}/pipecat/user-preferences",
+            content=orjson.dumps({"userId": user_id}),
+            headers=self._headers,
+        )
+
+        response.raise_for_status()
+        return orjson.loads(response.content).get("preferences")
+
     async def log_conversation(
         self,
         session_id: str,
@@ -284,7 +441,13 @@ class VoiceShopperActions:
         timestamp: int
     ) -> None:
         """
-        Log a conversation turn to Convex
+        Queue a conversation turn to be logged to Convex
+
+        Returns immediately; turns are posted in batches by the worker
+        running() owns, so logging never adds a network round-trip to a
+        response.
+        If Convex falls far enough behind that the queue is full, the turn
+        is dropped rather than blocking the caller.
 
         Args:
             session_id: Voice session ID
@@ -292,28 +455,99 @@ class VoiceShopperActions:
             text: Conversation text
             timestamp: Unix timestamp in milliseconds
         """
+        try:
+            self._log_queue.put_nowait({
+                "sessionId": session_id,
+                "speaker": speaker,
+                "text": text,
+                "timestamp": timestamp,
+            })
+        except asyncio.QueueFull:
+            logger.warning(f"[Action] Log queue full, dropping {speaker} turn for session {session_id}")
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator[None]:
+        """
+        Run the process-wide log worker for the duration of the block
+
+        The worker lives in a TaskGroup owned by the block, so it can't
+        outlive its owner. One worker serves every session so batches aren't
+        split between consumers. Leaving the block stops the worker, which
+        flushes everything still queued, and then closes the HTTP client.
+
+        Usage:
+            async with actions.running():
+                ...  # serve sessions
+        """
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                log_worker = tasks.create_task(self._log_worker())
+                try:
+                    yield
+                finally:
+                    # Stopping the worker drains the log queue
+                    log_worker.cancel()
+        finally:
+            await self.close()
+
+    async def _log_worker(self) -> None:
+        """Collect queued log entries and flush them to Convex in batches"""
+        batch: List[Dict[str, Any]] = []
+        in_flight: Optional[asyncio.Future] = None
+        try:
+            while True:
+                batch = [await self._log_queue.get()]
+
+                # Keep collecting until the batch is full or the flush interval elapses
+                deadline = asyncio.get_running_loop().time() + LOG_FLUSH_INTERVAL
+                while len(batch) < LOG_BATCH_SIZE:
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._log_queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                # Hand the batch off before awaiting, and shield the post, so
+                # cancelling mid-request neither aborts nor resends it
+                pending, batch = batch, []
+                in_flight = asyncio.ensure_future(self._post_log_batch(pending))
+                await asyncio.shield(in_flight)
+                in_flight = None
+
+        except asyncio.CancelledError:
+            # Let an interrupted post finish, then flush anything collected
+            # or still queued
+            if in_flight is not None:
+                await in_flight
+            while not self._log_queue.empty():
+                batch.append(self._log_queue.get_nowait())
+            for start in range(0, len(batch), LOG_BATCH_SIZE):
+                await self._post_log_batch(batch[start:start + LOG_BATCH_SIZE])
+            raise
+
+    async def _post_log_batch(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        Post a batch of conversation turns to Convex
+
+        Args:
+            entries: Log entries in Convex request format
+        """
         try:
             response = await self.client.post(
-                f"{self.convex_url}/pipecat/log-conversation",
-                json={
-                    "sessionId": session_id,
-                    "speaker": speaker,
-                    "text": text,
-                    "timestamp": timestamp,
-                },
-                headers={
-                    "X-Pipecat-Secret": self.secret,
-                    "Content-Type": "application/json",
-                }
+                f"{self.convex_url}/pipecat/log-conversation-batch",
+                content=orjson.dumps({"entries": entries}),
+                headers=self._headers,
             )
 
             response.raise_for_status()
-            logger.debug(f"[Action] Logged conversation turn for session {session_id}")
+            logger.debug(f"[Action] Logged {len(entries)} conversation turns")
 
         except Exception as e:
-            logger.warning(f"[Action] Failed to log conversation: {e}")
+            logger.warning(f"[Action] Failed to log {len(entries)} conversation turns: {e}")
             # Don't raise - logging failures shouldn't break the conversation
 
     async def close(self):
-        """Clean up resources"""
+        """Clean up resources; running() calls this on exit"""
         await self.client.aclose()
@@ -9,28 +9,29 @@ import sys
 import asyncio
 import logging
 from typing import Dict, Any, Optional
+from urllib.parse import parse_qsl
 from dotenv import load_dotenv
 
 # Import Pipecat framework components
 try:
-    from pipecat.pipeline.pipeline import Pipeline
-    from pipecat.pipeline.task import PipelineTask, PipelineParams
     from pipecat.pipeline.runner import PipelineRunner
-    from pipecat.processors.aggregators.llm_context import LLMContext
-    from pipecat.processors.aggregators.llm_response_universal import LLMContextAggregatorPair
-    from pipecat.services.google.llm import GoogleLLMService
-    from pipecat.services.cartesia.tts import CartesiaTTSService
-    from pipecat.audio.vad.silero import SileroVADAnalyzer
-    from pipecat.audio.vad.vad_analyzer import VADParams
     from pipecat.frames.frames import LLMRunFrame, EndFrame
+    from pipecat.transports.local.audio import LocalAudioTransport, LocalAudioTransportParams
 except ImportError as e:
     print(f"Error: Pipecat dependencies not installed. Run: pip install -r requirements.txt")
     print(f"Details: {e}")
     sys.exit(1)
 
+# Optional faster event loop (libuv-based); not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Import custom modules
-from actions import VoiceShopperActions
-from prompts import get_system_prompt
+from actions import VoiceShopperActions, new_id, now_ms
+from pipeline_factory import PipelineResources, build_pipeline
+from history import create_summary_model
 
 # Load environment variables
 load_dotenv()
@@ -65,6 +66,18 @@ class VoiceShopperAgent:
             secret=self.pipecat_secret
         )
 
+        # Built once; each session's pipeline is created from these
+        self.resources = PipelineResources(
+            google_api_key=self.google_api_key,
+            cartesia_api_key=self.cartesia_api_key,
+            actions=self.actions,
+            summary_model=create_summary_model(self.google_api_key),
+        )
+
+        # One runner drives every session's task; created on first use since
+        # PipelineRunner binds to the running event loop
+        self._runner: Optional[PipelineRunner] = None
+
     def _validate_config(self):
         """Validate that required environment variables are set"""
         required_vars = {
@@ -83,6 +96,17 @@ class VoiceShopperAgent:
 
         logger.info("Configuration validated successfully")
 
+    def _session_runner(self) -> PipelineRunner:
+        """
+        Get the runner shared by all sessions, creating it on first use
+
+        Signals are left to the host process rather than re-registered per
+        session. Must be called from inside the event loop.
+        """
+        if self._runner is None:
+            self._runner = PipelineRunner(handle_sigint=False)
+        return self._runner
+
     async def create_pipeline(self, session_id: str, user_id: str, transport):
         """
         Create a Pipecat pipeline for a voice session
@@ -95,114 +119,54 @@ class VoiceShopperAgent:
         Returns:
             Configured PipelineTask
         """
-        logger.info(f"Creating pipeline for session {session_id}, user {user_id}")
-
-        # Initialize LLM service (Gemini)
-        llm_service = GoogleLLMService(
-            api_key=self.google_api_key,
-            model="gemini-1.5-flash",
-        )
-
-        # Initialize TTS service (Cartesia TTS)
-        tts_service = CartesiaTTSService(
-            api_key=self.cartesia_api_key,
-            voice_id="71a7ad14-091c-4e8e-a314-022ece01c121",  # Pleasant female voice
-        )
-
-        # Build the system prompt with context
-        system_prompt = get_system_prompt()
-
-        # Setup conversation context
-        messages = [
-            {
-                "role": "system",
-                "content": system_prompt
-            }
-        ]
-
-        context = LLMContext(messages)
-        context_aggregator = LLMContextAggregatorPair(context)
-
-        # Create the pipeline
-        # The pipeline flow:
-        # 1. Audio input from transport
-        # 2. STT (handled by Google LLM service)
-        # 3. Context aggregator (manages conversation)
-        # 4. LLM (Gemini processes and responds)
-        # 5. TTS (text to speech)
-        # 6. Audio output via transport
-
-        pipeline = Pipeline([
-            transport.input(),
-            context_aggregator.user(),
-            llm_service,
-            tts_service,
-            transport.output(),
-            context_aggregator.assistant()
-        ])
-
-        # Set up custom action handlers
-        llm_service.register_function("search_products",
-            lambda args: self.actions.search_products(session_id, user_id, **args))
-        llm_service.register_function("save_item",
-            lambda args: self.actions.save_item(session_id, user_id, **args))
-        llm_service.register_function("get_user_preferences",
-            lambda args: self.actions.get_user_preferences(user_id))
-
-        # Create task with configuration
-        task = PipelineTask(
-            pipeline,
-            params=PipelineParams(
-                enable_metrics=True,
-                allow_interruptions=True
-            )
-        )
-
-        logger.info(f"Pipeline created successfully for session {session_id}")
-        return task
+        return build_pipeline(session_id, user_id, transport, self.resources)
 
     async def handle_session(self, websocket, path):
         """
         Handle a new WebSocket connection (voice session)
 
+        Must run inside actions.running(), whose log worker posts the
+        session's conversation logs.
+
         Args:
             websocket: WebSocket connection
             path: WebSocket path (can include session info)
         """
         # Parse session_id and user_id from WebSocket URL query parameters
-        from urllib.parse import urlparse, parse_qs
-
-        try:
-            # Parse query parameters from WebSocket path
-            parsed = urlparse(path)
-            query_params = parse_qs(parsed.query)
-
-            # Extract session ID (required)
-            session_id = query_params.get('sessionId', [None])[0]
-            if not session_id:
-                logger.warning(f"No sessionId in WebSocket connection: {path}")
-                session_id = f"session_{int(asyncio.get_event_loop().time() * 1000)}"
-
-            # Extract user ID (optional, may come from authentication)
-            user_id = query_params.get('userId', [None])[0]
-            if not user_id:
-                # Try to get from authentication headers or use generated ID
-                user_id = f"user_{int(asyncio.get_event_loop().time() * 1000)}"
-                logger.info(f"No userId provided, using generated: {user_id}")
-
-            logger.info(f"New session started: {session_id} for user {user_id}")
-
-        except Exception as e:
-            logger.error(f"Error parsing WebSocket parameters: {e}")
-            session_id = f"session_{int(asyncio.get_event_loop().time() * 1000)}"
-            user_id = f"user_{int(asyncio.get_event_loop().time() * 1000)}"
-            logger.warning(f"Using generated IDs: session={session_id}, user={user_id}")
+        query_params = dict(parse_qsl((path or "").partition("?")[2]))
+
+        # Extract session ID (required); reject the connection without one
+        session_id = query_params.get("sessionId")
+        if not session_id:
+            logger.warning(f"No sessionId in WebSocket connection: {path}")
+            await websocket.close(code=1008, reason="sessionId is required")
+            return
+
+        # Extract user ID (optional, may come from authentication)
+        user_id = query_params.get("userId")
+        if not user_id:
+            # Try to get from authentication headers or use generated ID
+            user_id = new_id("user")
+            logger.info(f"No userId provided, using generated: {user_id}")
+
+        logger.info(f"New session started: {session_id} for user {user_id}")
+
+        # The pipeline runs in a task group scoped to this handler, so
+        # cancelling the connection cancels the pipeline and waits for it
+        async with asyncio.TaskGroup() as session:
+            session.create_task(self._run_session(session_id, user_id))
+
+    async def _run_session(self, session_id: str, user_id: str):
+        """
+        Build and run one session's pipeline, reporting failures to Convex
 
+        Args:
+            session_id: Unique identifier for this voice session
+            user_id: User identifier
+        """
         try:
             # For now, use LocalAudioTransport for development
             # TODO: Implement proper WebSocket transport when available
-            from pipecat.transports.local.audio import LocalAudioTransport, LocalAudioTransportParams
-
             transport = LocalAudioTransport(
                 params=LocalAudioTransportParams(
                     audio_in_enabled=True,
@@ -216,8 +180,7 @@ class VoiceShopperAgent:
             task = await self.create_pipeline(session_id, user_id, transport)
 
             # Run the pipeline
-            runner = PipelineRunner()
-            await runner.run(task)
+            await self._session_runner().run(task)
 
             logger.info(f"Session {session_id} completed successfully")
 
@@ -228,13 +191,11 @@ class VoiceShopperAgent:
                 session_id=session_id,
                 speaker="system",
                 text=f"Session error: {str(e)}",
-                timestamp=asyncio.get_event_loop().time() * 1000
+                timestamp=now_ms()
             )
 
     async def run_local(self):
         """Run the agent locally for testing"""
-        from pipecat.transports.local.audio import LocalAudioTransport, LocalAudioTransportParams
-
         logger.info("Starting Voice Shopper Agent (local mode)")
         logger.info(f"Convex backend: {self.convex_url}")
         logger.info("Speak into your microphone to interact with the agent")
@@ -249,21 +210,27 @@ class VoiceShopperAgent:
             )
         )
 
+        await self.actions.warmup()
+
         # Create session IDs for testing
-        session_id = f"local_session_{int(asyncio.get_event_loop().time() * 1000)}"
+        session_id = new_id("local_session")
         user_id = "local_user"
 
         # Create the pipeline
         task = await self.create_pipeline(session_id, user_id, transport)
 
-        # Run the pipeline
-        runner = PipelineRunner(handle_sigint=True)
-        await runner.run(task)
+        # Run the pipeline; leaving running() flushes pending conversation logs
+        async with self.actions.running():
+            runner = PipelineRunner(handle_sigint=True)
+            await runner.run(task)
 
     def run(self):
         """Run the agent"""
         try:
-            asyncio.run(self.run_local())
+            if uvloop is not None:
+                uvloop.run(self.run_local())
+            else:
+                asyncio.run(self.run_local())
         except KeyboardInterrupt:
             logger.info("Agent stopped by user")
         except Exception as e:
@@ -0,0 +1,41 @@
+"""
+Sample-level audio conversions for the Voice Shopper agent
+Operate on numpy views of raw PCM and write into caller-owned buffers, so
+the per-frame audio path allocates nothing
+"""
+
+import numpy as np
+
+# Scale from s16le samples to [-1, 1) float32
+INT16_SCALE = np.float32(1.0 / 32768)
+
+
+def pcm_view(pcm) -> np.ndarray:
+    """
+    View raw s16le audio as int16 samples without copying
+
+    Args:
+        pcm: Raw audio bytes (bytes, bytearray or memoryview)
+
+    Returns:
+        Read-only int16 array over the same memory
+    """
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def s16_to_f32(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """
+    Convert int16 samples to float32 in [-1, 1)
+
+    A single vectorized multiply with an output buffer; numpy runs it as a
+    SIMD loop, which for VAD-sized windows beats a JIT kernel's dispatch
+    and threading overhead.
+
+    Args:
+        src: int16 samples
+        dst: float32 buffer of the same length to write into
+
+    Returns:
+        dst
+    """
+    return np.multiply(src, INT16_SCALE, out=dst)
@@ -0,0 +1,159 @@
+"""
+Conversation history summarization for the Voice Shopper agent
+Folds the oldest turns of a long conversation into a short summary so the
+prompt sent to Gemini stops growing with every turn
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from google import generativeai as genai
+from pipecat.frames.frames import Frame, LLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+logger = logging.getLogger(__name__)
+
+# Summarize once the history passes either limit (tokens are estimated)
+HISTORY_TOKEN_LIMIT = 4000
+HISTORY_MESSAGE_LIMIT = 40
+
+# Rough characters-per-token ratio for estimating prompt size
+CHARS_PER_TOKEN = 4
+
+SUMMARY_MODEL = "gemini-1.5-flash"
+SUMMARY_PREFIX = "Summary of the conversation so far: "
+SUMMARY_INSTRUCTION = (
+    "Summarize this shopping conversation in at most 200 tokens. Preserve the "
+    "user's stated preferences (style, budget, size, brands, colors), any "
+    "products found or saved, and anything the user is still looking for.\n\n"
+)
+
+
+def create_summary_model(api_key: str) -> genai.GenerativeModel:
+    """
+    Build the model used to summarize history; create once per process
+
+    Args:
+        api_key: Google API key
+
+    Returns:
+        Gemini model for HistorySummarizer
+    """
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(SUMMARY_MODEL)
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    Estimate the token count of a list of context messages
+
+    Args:
+        messages: Context messages
+
+    Returns:
+        Approximate number of tokens
+    """
+    return sum(len(_message_text(message)) for message in messages) // CHARS_PER_TOKEN
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    """Flatten a message's content to plain text"""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(message)
+
+
+class HistorySummarizer(FrameProcessor):
+    """
+    Keeps the LLM context bounded by summarizing its oldest turns
+
+    Sits between the user context aggregator and the LLM. When a context
+    passes the limits, the older half of the conversation is summarized in
+    the background and spliced in as one message, so the turn that
+    triggered it isn't delayed.
+    """
+
+    def __init__(
+        self,
+        model: genai.GenerativeModel,
+        token_limit: int = HISTORY_TOKEN_LIMIT,
+        message_limit: int = HISTORY_MESSAGE_LIMIT,
+        **kwargs,
+    ):
+        """
+        Initialize the summarizer
+
+        Args:
+            model: Summary model from create_summary_model()
+            token_limit: Estimated token count that triggers summarization
+            message_limit: Message count that triggers summarization
+            **kwargs: Passed through to FrameProcessor
+        """
+        super().__init__(**kwargs)
+        self._model = model
+        self._token_limit = token_limit
+        self._message_limit = message_limit
+        self._summary_task = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMContextFrame) and not self._summary_task:
+            messages = frame.context.get_messages()
+            if len(messages) > self._message_limit or estimate_tokens(messages) > self._token_limit:
+                self._summary_task = self.create_task(self._summarize(frame.context))
+
+        await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await super().cleanup()
+        if self._summary_task:
+            await self.cancel_task(self._summary_task)
+            self._summary_task = None
+
+    async def _summarize(self, context):
+        """Replace the oldest half of the conversation with a summary"""
+        try:
+            messages = context.get_messages()
+            split = _split_point(messages)
+            if split is None:
+                return
+
+            older = messages[1:split]
+            transcript = "\n".join(f"{m.get('role')}: {_message_text(m)}" for m in older)
+            response = await self._model.generate_content_async(SUMMARY_INSTRUCTION + transcript)
+            summary = {"role": "assistant", "content": SUMMARY_PREFIX + response.text.strip()}
+
+            # Only splice if the summarized turns are still in place
+            current = context.get_messages()
+            if current[1:split] == older:
+                context.set_messages([current[0], summary] + current[split:])
+                logger.info(f"Summarized {len(older)} messages ({estimate_tokens(older)} tokens)")
+
+        except Exception as e:
+            logger.warning(f"Failed to summarize conversation history: {e}")
+        finally:
+            self._summary_task = None
+
+
+def _split_point(messages: List[Dict[str, Any]]) -> Optional[int]:
+    """
+    Pick where the summarized prefix ends
+
+    The first message (the system prompt) is always kept. The split lands
+    on a user turn, so tool calls stay next to their results.
+
+    Args:
+        messages: Context messages
+
+    Returns:
+        Index of the first message to keep verbatim, or None if there is
+        nothing worth summarizing
+    """
+    for index in range(1 + len(messages) // 2, len(messages)):
+        if messages[index].get("role") == "user" and isinstance(messages[index].get("content"), str):
+            return index if index > 2 else None
+    return None
@@ -0,0 +1,130 @@
+"""
+Pipeline construction for the Voice Shopper agent
+Shared by the local agent and the WebSocket server so both run the same
+voice pipeline
+"""
+
+import copy
+import functools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.task import PipelineTask, PipelineParams
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.aggregators.llm_response_universal import LLMContextAggregatorPair
+from pipecat.services.google.llm import GoogleLLMService
+from pipecat.services.cartesia.tts import CartesiaTTSService
+
+from actions import VoiceShopperActions, invoke_tool
+from history import HistorySummarizer
+from prompts import SYSTEM_PROMPT_CORE
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = "gemini-1.5-flash"
+VOICE_ID = "71a7ad14-091c-4e8e-a314-022ece01c121"  # Pleasant female voice
+
+
+def _default_context_template() -> Tuple[Dict[str, Any], ...]:
+    """Initial conversation: just the system prompt"""
+    return ({"role": "system", "content": SYSTEM_PROMPT_CORE},)
+
+
+@dataclass(frozen=True)
+class PipelineResources:
+    """
+    Everything a session's pipeline is built from that doesn't change
+    between sessions
+
+    Created once per process. Pipecat services are frame processors linked
+    into a single pipeline, so they are still created per session; what is
+    shared is their configuration, the actions handler (and its HTTP
+    client), the history summary model, and the prebuilt initial context.
+    """
+
+    google_api_key: str
+    cartesia_api_key: str
+    actions: VoiceShopperActions
+    summary_model: Any
+    context_template: Tuple[Dict[str, Any], ...] = field(default_factory=_default_context_template)
+    llm_model: str = LLM_MODEL
+    voice_id: str = VOICE_ID
+
+    def new_messages(self) -> List[Dict[str, Any]]:
+        """Fresh copy of the initial context messages for a new session"""
+        return copy.deepcopy(list(self.context_template))
+
+
+def build_pipeline(
+    session_id: str,
+    user_id: str,
+    transport,
+    shared: PipelineResources,
+    context: Optional[LLMContext] = None,
+) -> PipelineTask:
+    """
+    Create a Pipecat pipeline for a voice session
+
+    Args:
+        session_id: Unique identifier for this voice session
+        user_id: User identifier from authentication
+        transport: Transport for this session
+        shared: Process-wide pipeline resources
+        context: Existing conversation context to continue (optional)
+
+    Returns:
+        Configured PipelineTask
+    """
+    logger.info(f"Creating pipeline for session {session_id}, user {user_id}")
+
+    # Initialize LLM service (Gemini)
+    llm_service = GoogleLLMService(
+        api_key=shared.google_api_key,
+        model=shared.llm_model,
+    )
+
+    # Initialize TTS service (Cartesia TTS)
+    tts_service = CartesiaTTSService(
+        api_key=shared.cartesia_api_key,
+        voice_id=shared.voice_id,
+    )
+
+    # Setup conversation context
+    if context is None:
+        context = LLMContext(shared.new_messages())
+    context_aggregator = LLMContextAggregatorPair(context)
+
+    # The pipeline flow:
+    # 1. Audio input from transport
+    # 2. Context aggregator (manages conversation, long histories summarized)
+    # 3. LLM (Gemini processes and responds)
+    # 4. TTS (text to speech)
+    # 5. Audio output via transport
+    pipeline = Pipeline([
+        transport.input(),
+        context_aggregator.user(),
+        HistorySummarizer(model=shared.summary_model),
+        llm_service,
+        tts_service,
+        transport.output(),
+        context_aggregator.assistant()
+    ])
+
+    # Set up custom action handlers
+    for name, handler, session_scoped in shared.actions.tool_handlers:
+        llm_service.register_function(
+            name, functools.partial(invoke_tool, handler, session_scoped, session_id, user_id))
+
+    # Create task with configuration
+    task = PipelineTask(
+        pipeline,
+        params=PipelineParams(
+            enable_metrics=True,
+            allow_interruptions=True
+        )
+    )
+
+    logger.info(f"Pipeline created successfully for session {session_id}")
+    return task
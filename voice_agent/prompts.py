@@ -2,15 +2,15 @@
 System prompts and conversation templates for the Voice Shopper agent
 """
 
+from typing import Final
 
-def get_system_prompt() -> str:
-    """
-    Get the main system prompt for the voice shopping agent
-
-    Returns:
-        System prompt string
-    """
-    return """You are a helpful AI shopping assistant that helps users find products through natural conversation.
+# Main system prompt, built once and shared by every session. The core
+# (role + guidelines) always ships. The example dialogs are kept out of
+# inline prompts, where every call would pay prefill for them; no code path
+# sends them today. The whole prompt is far below Gemini's minimum size for
+# context caching, so it can't be served from a cache either.
+# Import SYSTEM_PROMPT / SYSTEM_PROMPT_CORE directly where the choice is fixed.
+SYSTEM_PROMPT_CORE: Final[str] = """You are a helpful AI shopping assistant that helps users find products through natural conversation.
 
 Your role:
 - Listen carefully to what the user is looking for
@@ -30,6 +30,10 @@ Guidelines:
 7. Keep responses concise since this is a voice conversation
 8. If you encounter errors, explain them simply and offer to try again
 
+Remember: You're having a voice conversation, so keep responses natural and concise.
+"""
+
+_SYSTEM_PROMPT_EXAMPLES: Final[str] = """
 Example conversations:
 
 User: "I need a new laptop"
@@ -45,10 +49,24 @@ You: "Great! Let me search for gaming laptops under $1,500 for you."
 User: "Save the Dell one"
 You: "I've saved the Dell gaming laptop to your list! You can review it later."
 [Use save_item with the product details]
-
-Remember: You're having a voice conversation, so keep responses natural and concise.
 """
 
+SYSTEM_PROMPT: Final[str] = SYSTEM_PROMPT_CORE + _SYSTEM_PROMPT_EXAMPLES
+
+
+def get_system_prompt(include_examples: bool = True) -> str:
+    """
+    Get the main system prompt for the voice shopping agent
+
+    Args:
+        include_examples: Append the example conversations. Every call
+            that sends the prompt inline pays prefill for them.
+
+    Returns:
+        System prompt string
+    """
+    return SYSTEM_PROMPT if include_examples else SYSTEM_PROMPT_CORE
+
 
 def get_clarification_prompt(user_query: str) -> str:
     """
@@ -108,11 +126,9 @@ def format_results_for_prompt(results: list) -> str:
     Returns:
         Formatted results string
     """
-    formatted = []
-    for i, product in enumerate(results, 1):
-        formatted.append(
-            f"{i}. {product.get('title', 'Unknown Product')}\n"
-            f"   Price: ${product.get('price', 0):.2f}\n"
-            f"   {product.get('description', 'No description available')}\n"
-        )
-    return "\n".join(formatted)
+    return "\n".join(
+        f"{i}. {product.get('title', 'Unknown Product')}\n"
+        f"   Price: ${product.get('price', 0):.2f}\n"
+        f"   {product.get('description', 'No description available')}\n"
+        for i, product in enumerate(results, 1)
+    )
@@ -0,0 +1,287 @@
+"""
+Semantic response cache for the Voice Shopper agent
+Lets near-identical utterances ("find me a laptop" / "I need a laptop")
+reuse a previous response and its synthesized audio instead of
+round-tripping through the LLM and TTS again
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which two utterances are treated as the same request
+DEFAULT_THRESHOLD = 0.86
+
+# Upper bounds on stored entries and on the audio they hold in memory;
+# oldest entries are evicted first
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_AUDIO_BYTES = 8 * 1024 * 1024
+
+# Persisted layout: one small index plus one file per audio clip, so a new
+# entry writes its own clip instead of rewriting every stored one
+INDEX_FILE = "index.npz"
+CLIP_SUFFIX = ".pcm"
+
+
+@dataclass
+class CachedResponse:
+    """A previously generated response and its TTS audio"""
+
+    response_text: str
+    tts_audio_bytes: bytes
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache mapping user utterances to responses
+
+    Embeddings are L2-normalized so an inner product against the stored
+    matrix is the cosine similarity (the same search a flat inner-product
+    index performs). The cache is namespaced by user and system prompt hash
+    so a prompt change never serves stale answers.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[Sequence[float]]],
+        user_id: str,
+        system_prompt: str,
+        cache_dir: Optional[str] = None,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_audio_bytes: int = DEFAULT_MAX_AUDIO_BYTES,
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            embed: Coroutine function returning an embedding for a text
+            user_id: User the cached responses belong to
+            system_prompt: System prompt the responses were generated with
+            cache_dir: Directory to persist the cache in (in-memory only if None)
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum number of stored responses
+            max_audio_bytes: Maximum total size of the stored audio
+        """
+        self._embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_audio_bytes = max_audio_bytes
+
+        self._matrix: Optional[np.ndarray] = None
+        self._entries: List[CachedResponse] = []
+        self._clips: List[str] = []
+        self._audio_bytes = 0
+
+        # Persistence state: one writer at a time, and the clips already on disk
+        self._save_lock = asyncio.Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._saved_clips = set()
+
+        prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+        key = hashlib.sha256(f"{user_id}:{prompt_hash}".encode("utf-8")).hexdigest()[:16]
+        self._dir = os.path.join(cache_dir, f"semantic_cache_{key}") if cache_dir else None
+
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def lookup(self, text: str) -> Tuple[Optional[CachedResponse], Optional[np.ndarray]]:
+        """
+        Find a cached response for an utterance
+
+        Args:
+            text: The user's utterance
+
+        Returns:
+            Tuple of (cached response or None, normalized embedding of text).
+            The embedding is None if embedding failed; pass it to store() on a miss.
+        """
+        try:
+            embedding = _normalize(np.asarray(await self._embed(text), dtype=np.float32))
+        except Exception as e:
+            logger.warning(f"[Cache] Failed to embed utterance: {e}")
+            return None, None
+
+        if self._matrix is None:
+            return None, embedding
+
+        scores = self._matrix @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            logger.info(f"[Cache] Hit (similarity {scores[best]:.3f})")
+            return self._entries[best], embedding
+
+        return None, embedding
+
+    async def store(self, embedding: np.ndarray, response_text: str, tts_audio_bytes: bytes) -> None:
+        """
+        Store a response under the embedding returned by lookup()
+
+        Args:
+            embedding: Normalized embedding of the user's utterance
+            response_text: LLM response text
+            tts_audio_bytes: Synthesized audio for the response
+        """
+        if len(tts_audio_bytes) > self.max_audio_bytes:
+            logger.debug(f"[Cache] Not caching {len(tts_audio_bytes)}-byte response; larger than the cache")
+            return
+
+        row = embedding.reshape(1, -1)
+        if self._matrix is None:
+            self._matrix = row
+        else:
+            self._matrix = np.vstack((self._matrix, row))
+        self._entries.append(CachedResponse(response_text, tts_audio_bytes))
+        self._clips.append(hashlib.sha256(tts_audio_bytes).hexdigest()[:32])
+        self._audio_bytes += len(tts_audio_bytes)
+        self._evict()
+        self._version += 1
+
+        if self._dir:
+            await self._persist()
+
+    def _evict(self) -> None:
+        """Drop the oldest entries until the cache is within its limits"""
+        overflow = max(0, len(self._entries) - self.max_entries)
+        audio_bytes = self._audio_bytes - sum(len(e.tts_audio_bytes) for e in self._entries[:overflow])
+        while audio_bytes > self.max_audio_bytes:
+            audio_bytes -= len(self._entries[overflow].tts_audio_bytes)
+            overflow += 1
+
+        if overflow:
+            self._entries = self._entries[overflow:]
+            self._clips = self._clips[overflow:]
+            self._matrix = self._matrix[overflow:] if self._entries else None
+            self._audio_bytes = audio_bytes
+
+    async def _persist(self) -> None:
+        """Write the current state to disk, one writer at a time"""
+        async with self._save_lock:
+            # Stores that queued behind the previous write are covered by
+            # this snapshot, so bursts collapse into a single write
+            if self._saved_version == self._version:
+                return
+
+            version = self._version
+            clips = list(self._clips)
+            new_clips = {
+                name: entry.tts_audio_bytes
+                for name, entry in zip(clips, self._entries)
+                if name not in self._saved_clips
+            }
+            matrix = self._matrix.copy() if self._matrix is not None else None
+            texts = [e.response_text for e in self._entries]
+
+            if await asyncio.to_thread(self._save, matrix, texts, clips, new_clips):
+                self._saved_version = version
+                self._saved_clips = set(clips)
+
+    def _load(self) -> None:
+        """Load a persisted cache from disk, if any"""
+        if not self._dir:
+            return
+
+        index_path = os.path.join(self._dir, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+
+        try:
+            # Plain arrays only; allow_pickle=False means a tampered file
+            # can fail to load but can't run code
+            with np.load(index_path, allow_pickle=False) as data:
+                matrix = data["matrix"]
+                texts = data["texts"].tolist()
+                clips = data["clips"].tolist()
+
+            rows = []
+            for row, (text, name) in enumerate(zip(texts, clips)):
+                try:
+                    with open(self._clip_path(name), "rb") as f:
+                        audio = f.read()
+                except OSError:
+                    continue
+                rows.append(row)
+                self._entries.append(CachedResponse(text, audio))
+                self._clips.append(name)
+                self._audio_bytes += len(audio)
+
+            self._matrix = matrix[rows] if rows else None
+            self._saved_clips = set(self._clips)
+            self._evict()
+            logger.info(f"[Cache] Loaded {len(self._entries)} cached responses from {self._dir}")
+        except Exception as e:
+            logger.warning(f"[Cache] Failed to load cache from {self._dir}: {e}")
+            self._matrix, self._entries, self._clips, self._audio_bytes = None, [], [], 0
+
+    def _save(
+        self,
+        matrix: Optional[np.ndarray],
+        texts: List[str],
+        clips: List[str],
+        new_clips: Dict[str, bytes],
+    ) -> bool:
+        """
+        Persist the cache to disk
+
+        Writes the clips that aren't on disk yet, then the index, then
+        removes clips no entry refers to any more.
+
+        Returns:
+            Whether the write succeeded
+        """
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+
+            for name, audio in new_clips.items():
+                self._write_atomic(self._clip_path(name), lambda f, audio=audio: f.write(audio))
+
+            if matrix is None:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            self._write_atomic(os.path.join(self._dir, INDEX_FILE), lambda f: np.savez(
+                f,
+                matrix=matrix,
+                texts=np.array(texts, dtype=np.str_),
+                clips=np.array(clips, dtype=np.str_),
+            ))
+
+            keep = {name + CLIP_SUFFIX for name in clips}
+            for filename in os.listdir(self._dir):
+                if filename.endswith(CLIP_SUFFIX) and filename not in keep:
+                    os.remove(os.path.join(self._dir, filename))
+            return True
+
+        except Exception as e:
+            logger.warning(f"[Cache] Failed to persist cache to {self._dir}: {e}")
+            return False
+
+    def _clip_path(self, name: str) -> str:
+        """Path of a stored audio clip"""
+        return os.path.join(self._dir, name + CLIP_SUFFIX)
+
+    def _write_atomic(self, path: str, write: Callable) -> None:
+        """Write a file through its own temp file so readers never see a partial one"""
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    """L2-normalize a vector so inner products are cosine similarities"""
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -7,37 +7,41 @@ Real-time AI voice agent accessible from the web browser
 import os
 import sys
 import logging
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
+# Optional faster event loop (libuv-based); not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Import Pipecat framework components
 try:
-    from pipecat.pipeline.pipeline import Pipeline
-    from pipecat.pipeline.task import PipelineTask, PipelineParams
     from pipecat.pipeline.runner import PipelineRunner
     from pipecat.processors.aggregators.llm_context import LLMContext
-    from pipecat.processors.aggregators.llm_response_universal import LLMContextAggregatorPair
-    from pipecat.services.google.llm import GoogleLLMService
-    from pipecat.services.cartesia.tts import CartesiaTTSService
     from pipecat.transports.websocket.fastapi import (
         FastAPIWebsocketTransport,
         FastAPIWebsocketParams
     )
-    from pipecat.audio.vad.silero import SileroVADAnalyzer
     from pipecat.serializers.protobuf import ProtobufFrameSerializer
-    from pipecat.frames.frames import LLMRunFrame, EndFrame
+    from pipecat.frames.frames import LLMRunFrame, EndFrame, OutputTransportMessageUrgentFrame
 except ImportError as e:
     print(f"Error: Pipecat dependencies not installed. Run: pip install -r requirements.txt")
     print(f"Details: {e}")
     sys.exit(1)
 
 # Import custom modules
-from actions import VoiceShopperActions
-from prompts import get_system_prompt
+from actions import VoiceShopperActions, new_id, now_ms
+from vad import EnergyGatedVADAnalyzer, get_vad_session
+from pipeline_factory import PipelineResources, build_pipeline
+from history import create_summary_model
+from session_store import SessionContextStore
 
 # Load environment variables
 load_dotenv()
@@ -49,8 +53,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the server when a worker starts and release it on shutdown
+
+    Building it here rather than at import keeps each uvicorn worker's
+    connections and caches its own.
+    """
+    server = VoiceShopperServer()
+    await server.actions.warmup()
+    app.state.server = server
+
+    # The lifespan owns the log worker; shutdown flushes queued logs
+    async with server.actions.running():
+        yield
+
+
 # FastAPI app
-app = FastAPI(title="Voice Shopper API")
+app = FastAPI(title="Voice Shopper API", lifespan=lifespan)
 
 # Add CORS middleware to allow browser connections
 app.add_middleware(
@@ -80,6 +102,24 @@ class VoiceShopperServer:
             secret=self.pipecat_secret
         )
 
+        # Built once; each session's pipeline is created from these
+        self.resources = PipelineResources(
+            google_api_key=self.google_api_key,
+            cartesia_api_key=self.cartesia_api_key,
+            actions=self.actions,
+            summary_model=create_summary_model(self.google_api_key),
+        )
+
+        # One runner drives every session's task; signals are left to the
+        # host process rather than re-registered per session
+        self.runner = PipelineRunner(handle_sigint=False)
+
+        # Load the VAD model once; every connection's analyzer shares it
+        self.vad_session = get_vad_session()
+
+        # Conversation contexts, kept so dropped connections can resume
+        self.sessions = SessionContextStore()
+
     def _validate_config(self):
         """Validate that required environment variables are set"""
         required_vars = {
@@ -98,86 +138,34 @@ class VoiceShopperServer:
 
         logger.info("Configuration validated successfully")
 
-    async def create_pipeline(self, session_id: str, user_id: str, transport):
+    async def create_pipeline(
+        self,
+        session_id: str,
+        user_id: str,
+        resume_token: Optional[str],
+        transport,
+    ) -> Tuple[Any, Optional[str], bool]:
         """
         Create a Pipecat pipeline for a voice session
 
         Args:
             session_id: Unique identifier for this voice session
             user_id: User identifier from authentication
+            resume_token: Token the client was issued for this session, if any
             transport: WebSocket transport for this session
 
         Returns:
-            Configured PipelineTask
+            Tuple of (configured PipelineTask, resume token to send the
+            client or None, whether the session resumed)
         """
-        logger.info(f"Creating pipeline for session {session_id}, user {user_id}")
-
-        # Initialize LLM service (Gemini)
-        llm_service = GoogleLLMService(
-            api_key=self.google_api_key,
-            model="gemini-1.5-flash",
-        )
-
-        # Initialize TTS service (Cartesia TTS)
-        tts_service = CartesiaTTSService(
-            api_key=self.cartesia_api_key,
-            voice_id="71a7ad14-091c-4e8e-a314-022ece01c121",  # Pleasant female voice
-        )
+        # A reconnect holding the session's token continues its conversation
+        context, resume_token, resumed = self.sessions.get_or_create(
+            session_id, resume_token, lambda: LLMContext(self.resources.new_messages()))
+        task = build_pipeline(session_id, user_id, transport, self.resources, context)
 
-        # Build the system prompt with context
-        system_prompt = get_system_prompt()
-
-        # Setup conversation context
-        messages = [
-            {
-                "role": "system",
-                "content": system_prompt
-            }
-        ]
-
-        context = LLMContext(messages)
-        context_aggregator = LLMContextAggregatorPair(context)
-
-        # Create the pipeline
-        # The pipeline flow:
-        # 1. Audio input from browser via WebSocket
-        # 2. Context aggregator (manages conversation)
-        # 3. LLM (Gemini processes and responds)
-        # 4. TTS (text to speech)
-        # 5. Audio output via WebSocket back to browser
-
-        pipeline = Pipeline([
-            transport.input(),
-            context_aggregator.user(),
-            llm_service,
-            tts_service,
-            transport.output(),
-            context_aggregator.assistant()
-        ])
-
-        # Set up custom action handlers
-        llm_service.register_function("search_products",
-            lambda args: self.actions.search_products(session_id, user_id, **args))
-        llm_service.register_function("save_item",
-            lambda args: self.actions.save_item(session_id, user_id, **args))
-        llm_service.register_function("get_user_preferences",
-            lambda args: self.actions.get_user_preferences(user_id))
-
-        # Create task with configuration
-        task = PipelineTask(
-            pipeline,
-            params=PipelineParams(
-                enable_metrics=True,
-                allow_interruptions=True
-            )
-        )
-
-        logger.info(f"Pipeline created successfully for session {session_id}")
-        return task
-
-
-# Initialize server instance
-server = VoiceShopperServer()
+        # Supersedes any pipeline still running this session
+        await self.sessions.claim(session_id, context, resume_token, task)
+        return task, resume_token, resumed
 
 
 @app.get("/")
@@ -199,10 +187,14 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection accepted")
 
-    # Generate session ID
-    import time
-    session_id = f"session_{int(time.time() * 1000)}"
+    server = websocket.app.state.server
+
+    # Resume the client's session if it sent one with its resume token,
+    # otherwise start a new one
+    session_id = websocket.query_params.get("sessionId") or new_id("session")
+    resume_token = websocket.query_params.get("resumeToken")
     user_id = "browser_user"  # TODO: Get from authentication
+    task = None
 
     try:
         # Create WebSocket transport
@@ -212,29 +204,39 @@ async def websocket_endpoint(websocket: WebSocket):
                 audio_in_enabled=True,
                 audio_out_enabled=True,
                 add_wav_header=True,
-                vad_analyzer=SileroVADAnalyzer(),
+                vad_analyzer=EnergyGatedVADAnalyzer(),
                 serializer=ProtobufFrameSerializer()
             )
         )
 
         # Create the pipeline for this session
-        task = await server.create_pipeline(session_id, user_id, transport)
+        task, resume_token, resumed = await server.create_pipeline(
+            session_id, user_id, resume_token, transport)
 
         # Handle connection event
         @transport.event_handler("on_client_connected")
         async def on_connected(transport, client):
             logger.info(f"Client connected: {client}")
-            # Start the conversation
-            await task.queue_frames([LLMRunFrame()])
+            # The client reconnects with this token to resume the session
+            if resume_token:
+                await task.queue_frames([OutputTransportMessageUrgentFrame(message={
+                    "type": "session",
+                    "sessionId": session_id,
+                    "resumeToken": resume_token,
+                })])
+            # Start the conversation; resumed sessions wait for the user
+            if not resumed:
+                await task.queue_frames([LLMRunFrame()])
 
         @transport.event_handler("on_client_disconnected")
         async def on_disconnected(transport, client):
             logger.info(f"Client disconnected: {client}")
-            await task.cancel()
+            # The pipeline may already be ending on its own
+            if not task.has_finished():
+                await task.cancel()
 
         # Run the pipeline
-        runner = PipelineRunner()
-        await runner.run(task)
+        await server.runner.run(task)
 
         logger.info(f"Session {session_id} completed successfully")
 
@@ -247,8 +249,12 @@ async def websocket_endpoint(websocket: WebSocket):
             session_id=session_id,
             speaker="system",
             text=f"Session error: {str(e)}",
-            timestamp=time.time() * 1000
+            timestamp=now_ms()
         )
+    finally:
+        # Starts the session's resume window
+        if task is not None:
+            server.sessions.release(session_id, task)
 
 
 def main():
@@ -258,12 +264,19 @@ def main():
 
     host = os.getenv("SERVER_HOST", "0.0.0.0")
     port = int(os.getenv("SERVER_PORT", "8000"))
+    workers = int(os.getenv("SERVER_WORKERS", "1"))
 
+    # Each worker holds its own session state, so resuming a session only
+    # works if the client lands on the same worker
     uvicorn.run(
-        app,
+        "server:app",
         host=host,
         port=port,
-        log_level="info"
+        loop="uvloop" if uvloop is not None else "asyncio",
+        http="httptools",
+        ws="websockets",
+        log_level="info",
+        workers=workers
     )
 
 
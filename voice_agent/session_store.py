@@ -0,0 +1,141 @@
+"""
+Session context store for the Voice Shopper agent
+Keeps each session's conversation context around after its websocket
+closes, so a client that reconnects picks up where it left off instead of
+starting a new conversation
+"""
+
+import hmac
+import logging
+import secrets
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Most disconnected sessions kept at once; the least recently used is dropped first
+SESSION_STORE_SIZE = 256
+
+# Seconds a disconnected session can be resumed for
+SESSION_STORE_TTL = 1800
+
+
+@dataclass
+class _StoredSession:
+    """A session's context, the token that resumes it, and its live pipeline"""
+
+    resume_token: str
+    context: Any
+    task: Optional[Any] = None
+
+
+class SessionContextStore:
+    """
+    session_id -> LLM context, resumable only with the token issued for it
+
+    A new session is issued an unguessable resume token, which the server
+    hands to the client; reconnecting with the same session ID and that
+    token resumes the context. Session IDs alone are never enough, since
+    any client can send one.
+
+    Contexts are held by reference, so the turns a pipeline appends while it
+    runs are already in the store when the connection drops. Sessions with a
+    live pipeline are held outside the LRU so they can't expire mid-call;
+    the TTL starts when the pipeline is released.
+    """
+
+    def __init__(self, maxsize: int = SESSION_STORE_SIZE, ttl: float = SESSION_STORE_TTL):
+        """
+        Initialize the store
+
+        Args:
+            maxsize: Maximum number of disconnected sessions kept
+            ttl: Seconds after disconnect before a session expires
+        """
+        self._idle: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._active: Dict[str, _StoredSession] = {}
+
+    def get_or_create(
+        self,
+        session_id: str,
+        resume_token: Optional[str],
+        create: Callable[[], Any],
+    ) -> Tuple[Any, Optional[str], bool]:
+        """
+        Resume a session's context, or start a new one
+
+        Args:
+            session_id: Session identifier
+            resume_token: Token the client was issued for this session, if any
+            create: Context factory, called only when not resuming
+
+        Returns:
+            Tuple of (context, resume token to give the client, whether the
+            session was resumed). The token is None when the session ID
+            already belongs to another client, so this connection can't be
+            resumed later.
+        """
+        session = self._active.get(session_id) or self._idle.get(session_id)
+        if session is None:
+            return create(), secrets.token_urlsafe(32), False
+
+        if resume_token and hmac.compare_digest(session.resume_token, resume_token):
+            logger.info(f"Resuming context for session {session_id}")
+            return session.context, session.resume_token, True
+
+        # Known session without its token; never hand over or replace its context
+        logger.warning(f"Session {session_id} reconnected without a valid resume token; starting an unstored context")
+        return create(), None, False
+
+    async def claim(self, session_id: str, context: Any, resume_token: Optional[str], task) -> None:
+        """
+        Mark a pipeline as the one running a session
+
+        A reconnect can arrive before the server notices the old socket is
+        dead; the old pipeline is cancelled so only one appends to the
+        shared context.
+
+        Args:
+            session_id: Session identifier
+            context: Context the pipeline was built with
+            resume_token: Token returned by get_or_create(); None leaves
+                the session unstored
+            task: The new PipelineTask
+        """
+        if resume_token is None:
+            return
+
+        session = self._active.get(session_id) or self._idle.pop(session_id, None)
+        if session is None:
+            session = _StoredSession(resume_token, context)
+        elif session.context is not context:
+            # Another client started this session ID first; keep theirs
+            if session.task is None:
+                self._idle[session_id] = session
+            return
+
+        previous = session.task
+        session.task = task
+        self._active[session_id] = session
+
+        if previous is not None and not previous.has_finished():
+            logger.info(f"Cancelling superseded pipeline for session {session_id}")
+            await previous.cancel()
+
+    def release(self, session_id: str, task) -> None:
+        """
+        Mark a session's pipeline as finished, starting its resume window
+
+        Args:
+            session_id: Session identifier
+            task: The PipelineTask that finished
+        """
+        session = self._active.get(session_id)
+        if session is None or session.task is not task:
+            return
+
+        session.task = None
+        del self._active[session_id]
+        self._idle[session_id] = session
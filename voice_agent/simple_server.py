@@ -8,16 +8,28 @@ import os
 import sys
 import asyncio
 import logging
-import json
-from typing import Dict
+import re
+import base64
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+import httpx
+import orjson
+from cachetools import LRUCache
 import uvicorn
 
+# Optional faster event loop (libuv-based); not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Import Pipecat framework components
 try:
+    from google import generativeai as genai
     from pipecat.services.google.llm import GoogleLLMService
     from pipecat.services.cartesia.tts import CartesiaTTSService
     from pipecat.processors.aggregators.llm_context import LLMContext
@@ -27,7 +39,9 @@ except ImportError as e:
     sys.exit(1)
 
 # Import custom modules
+from actions import new_id
 from prompts import get_system_prompt
+from semantic_cache import SemanticCache, DEFAULT_THRESHOLD, DEFAULT_MAX_AUDIO_BYTES
 
 # Load environment variables
 load_dotenv()
@@ -39,8 +53,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Spoken fallback when the LLM call fails (never cached)
+ERROR_RESPONSE = "I'm sorry, I encountered an error processing your request."
+
+# Chunk boundaries for streaming text to TTS: end of sentence, or a comma
+# once the pending clause is long enough to be worth speaking on its own
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_CLAUSE_END = re.compile(r"(?<=,)\s+")
+MIN_CLAUSE_CHARS = 60
+
+# How long a turn waits on the semantic cache before going to the LLM; a
+# slower lookup still finishes in the background so a miss can be stored
+CACHE_LOOKUP_TIMEOUT = 0.15
+
+# Most users' semantic caches held in memory at once; the least recently
+# used is dropped (and reloaded from SEMANTIC_CACHE_DIR if it comes back).
+# With each cache's audio capped, this bounds the caches' total memory
+SEMANTIC_CACHE_USERS = 64
+
+# Format of the PCM audio sent to clients in binary frames
+AUDIO_SAMPLE_RATE = 24000
+AUDIO_ENCODING = "pcm_s16le"
+
+# Streamed audio is coalesced into frames of this size (100 ms) before sending
+AUDIO_FRAME_BYTES = AUDIO_SAMPLE_RATE // 10 * 2
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the server when a worker starts and release it on shutdown
+
+    Building it here rather than at import keeps each uvicorn worker's
+    connections and caches its own.
+    """
+    server = VoiceShopperServer()
+    app.state.server = server
+
+    yield
+
+    await server.close()
+
+
 # FastAPI app
-app = FastAPI(title="Voice Shopper API")
+app = FastAPI(title="Voice Shopper API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -60,6 +116,37 @@ class VoiceShopperServer:
         self.cartesia_api_key = os.getenv("CARTESIA_API_KEY")
         self._validate_config()
 
+        # Semantic response caches, one per user; keyed by a client-supplied
+        # userId, so the number kept is bounded
+        self.cache_dir = os.getenv("SEMANTIC_CACHE_DIR")
+        self.cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD))
+        self.cache_max_audio_bytes = int(os.getenv("SEMANTIC_CACHE_MAX_AUDIO_BYTES", DEFAULT_MAX_AUDIO_BYTES))
+        self._caches: LRUCache = LRUCache(maxsize=SEMANTIC_CACHE_USERS)
+
+        # The prompt goes inline with every call, so the example dialogs are
+        # left out to keep its prefill small
+        self.system_prompt = get_system_prompt(include_examples=False)
+
+        # Build the Gemini model once; each session gets its own chat so prior
+        # turns are carried by the chat instead of rebuilt into every prompt
+        genai.configure(api_key=self.google_api_key)
+        self._model = genai.GenerativeModel('gemini-1.5-flash', system_instruction=self.system_prompt)
+        self._chats: Dict[str, genai.ChatSession] = {}
+
+        # One keep-alive HTTP/2 client for Cartesia so each utterance reuses
+        # the open connection instead of paying a TCP + TLS handshake
+        self._http = httpx.AsyncClient(
+            http2=True,
+            base_url="https://api.cartesia.ai",
+            headers={
+                "X-API-Key": self.cartesia_api_key,
+                "Cartesia-Version": "2024-06-10",
+                "Content-Type": "application/json",
+            },
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+
     def _validate_config(self):
         """Validate configuration"""
         required_vars = {
@@ -74,80 +161,246 @@ class VoiceShopperServer:
 
         logger.info("Configuration validated successfully")
 
-    async def process_text(self, text: str) -> str:
+    def get_cache(self, user_id: str) -> SemanticCache:
         """
-        Process text through Gemini LLM
+        Get the semantic response cache for a user
 
         Args:
-            text: User's text input
+            user_id: User identifier
 
         Returns:
-            LLM response text
+            SemanticCache for this user and the current system prompt
         """
-        try:
-            # Initialize Gemini
-            from google import generativeai as genai
-            genai.configure(api_key=self.google_api_key)
-            model = genai.GenerativeModel('gemini-1.5-flash')
+        cache = self._caches.get(user_id)
+        if cache is None:
+            cache = SemanticCache(
+                embed=self.embed_text,
+                user_id=user_id,
+                system_prompt=self.system_prompt,
+                cache_dir=self.cache_dir,
+                threshold=self.cache_threshold,
+                max_audio_bytes=self.cache_max_audio_bytes,
+            )
+            self._caches[user_id] = cache
+        return cache
+
+    async def embed_text(self, text: str) -> list:
+        """
+        Embed text with Gemini for semantic similarity lookups
 
-            # Get system prompt
-            system_prompt = get_system_prompt()
+        Args:
+            text: Text to embed
 
+        Returns:
+            Embedding vector
+        """
+        result = await genai.embed_content_async(
+            model="models/text-embedding-004",
+            content=text,
+            task_type="semantic_similarity",
+        )
+        return result["embedding"]
+
+    def get_chat(self, session_id: str) -> genai.ChatSession:
+        """
+        Get the Gemini chat for a session, starting one if needed
+
+        Args:
+            session_id: WebSocket session ID
+
+        Returns:
+            ChatSession holding the session's conversation history
+        """
+        chat = self._chats.get(session_id)
+        if chat is None:
+            chat = self._model.start_chat(history=[])
+            self._chats[session_id] = chat
+        return chat
+
+    def has_history(self, session_id: str) -> bool:
+        """Whether a session already has conversation turns"""
+        chat = self._chats.get(session_id)
+        return bool(chat and chat.history)
+
+    def record_turn(self, session_id: str, user_text: str, response_text: str):
+        """
+        Add a turn answered outside the LLM (e.g. from cache) to a session's history
+
+        Args:
+            session_id: WebSocket session ID
+            user_text: What the user said
+            response_text: What the assistant answered
+        """
+        chat = self.get_chat(session_id)
+        chat.history = [
+            *chat.history,
+            {"role": "user", "parts": [user_text]},
+            {"role": "model", "parts": [response_text]},
+        ]
+
+    def end_session(self, session_id: str):
+        """Drop a session's chat history"""
+        self._chats.pop(session_id, None)
+
+    async def stream_response(self, session_id: str, text: str) -> AsyncIterator[str]:
+        """
+        Stream a Gemini response in speakable chunks
+
+        Tokens are buffered and released at sentence boundaries (or at a
+        comma once a clause gets long) so TTS can start on the first
+        sentence while the rest is still being generated.
+
+        Args:
+            session_id: WebSocket session ID
+            text: User's text input
+
+        Yields:
+            Response text chunks, or ERROR_RESPONSE if generation fails
+        """
+        buffer = ""
+        try:
             # Generate response
-            full_prompt = f"{system_prompt}\n\nUser: {text}\n\nAssistant:"
-            response = model.generate_content(full_prompt)
+            chat = self.get_chat(session_id)
+            response = await chat.send_message_async(text, stream=True)
+
+            async for part in response:
+                buffer += part.text
+                chunk, buffer = _split_speakable(buffer)
+                if chunk:
+                    yield chunk
 
-            return response.text
+            if buffer.strip():
+                yield buffer.strip()
 
         except Exception as e:
             logger.error(f"Error processing text: {e}")
-            return "I'm sorry, I encountered an error processing your request."
+            # A failed streamed turn leaves the chat unusable; start over
+            self.end_session(session_id)
+            yield ERROR_RESPONSE
+
+    async def close(self):
+        """Clean up resources"""
+        await self._http.aclose()
+
+    def _tts_request(self, text: str) -> dict:
+        """Build a Cartesia TTS request body for raw 24 kHz PCM"""
+        return {
+            "model_id": "sonic-english",
+            "transcript": text,
+            "voice": {
+                "mode": "id",
+                "id": "71a7ad14-091c-4e8e-a314-022ece01c121"
+            },
+            "output_format": {
+                "container": "raw",
+                "encoding": AUDIO_ENCODING,
+                "sample_rate": AUDIO_SAMPLE_RATE
+            }
+        }
 
-    async def synthesize_speech(self, text: str) -> bytes:
+    async def stream_speech(self, text: str) -> AsyncIterator[bytes]:
         """
-        Convert text to speech using Cartesia
+        Stream speech from Cartesia as it is synthesized
+
+        Uses the SSE endpoint so the first audio arrives after the first
+        generated chunk rather than after the whole utterance.
 
         Args:
             text: Text to convert to speech
 
-        Returns:
-            Audio bytes
+        Yields:
+            Raw PCM audio chunks
+
+        Raises:
+            SpeechSynthesisError: If synthesis fails; audio yielded so far
+                is incomplete
         """
         try:
-            import httpx
-
-            url = "https://api.cartesia.ai/tts/bytes"
-            headers = {
-                "X-API-Key": self.cartesia_api_key,
-                "Cartesia-Version": "2024-06-10",
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model_id": "sonic-english",
-                "transcript": text,
-                "voice": {
-                    "mode": "id",
-                    "id": "71a7ad14-091c-4e8e-a314-022ece01c121"
-                },
-                "output_format": {
-                    "container": "raw",
-                    "encoding": "pcm_s16le",
-                    "sample_rate": 24000
-                }
-            }
-
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=headers, json=data, timeout=30.0)
+            async with self._http.stream("POST", "/tts/sse", content=orjson.dumps(self._tts_request(text))) as response:
                 response.raise_for_status()
-                return response.content
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+
+                    event = orjson.loads(line[len("data:"):])
+                    if event.get("type") == "error":
+                        raise RuntimeError(event.get("error") or event)
+                    if event.get("data"):
+                        yield base64.b64decode(event["data"])
+                    if event.get("done"):
+                        break
 
         except Exception as e:
-            logger.error(f"Error synthesizing speech: {e}")
-            return b""
+            logger.error(f"Error streaming speech: {e}")
+            raise SpeechSynthesisError(str(e)) from e
 
 
-# Initialize server
-server = VoiceShopperServer()
+class SpeechSynthesisError(Exception):
+    """Raised when Cartesia fails to synthesize a chunk of speech"""
+
+
+def _split_speakable(buffer: str) -> Tuple[str, str]:
+    """
+    Split buffered LLM text into a chunk ready for TTS and the remainder
+
+    Args:
+        buffer: Text received so far that hasn't been spoken
+
+    Returns:
+        Tuple of (text ready to speak, possibly empty; remaining text)
+    """
+    last = None
+    for last in _SENTENCE_END.finditer(buffer):
+        pass
+
+    if last is None and len(buffer) >= MIN_CLAUSE_CHARS:
+        for last in _CLAUSE_END.finditer(buffer):
+            pass
+
+    if last is None:
+        return "", buffer
+    return buffer[:last.start()].strip(), buffer[last.end():]
+
+
+class AudioFrameWriter:
+    """
+    Coalesces streamed PCM chunks into fixed-size binary websocket frames
+
+    One preallocated buffer is reused for every frame and sent as a
+    memoryview slice. send_bytes() hands the payload to the websocket
+    protocol, which copies it into the outgoing frame before returning, so
+    the buffer can be refilled as soon as the send completes.
+    """
+
+    def __init__(self, websocket: WebSocket, frame_bytes: int = AUDIO_FRAME_BYTES):
+        """
+        Initialize the writer
+
+        Args:
+            websocket: Client connection
+            frame_bytes: Frame size; must be a whole number of samples
+        """
+        self._websocket = websocket
+        self._buffer = memoryview(bytearray(frame_bytes))
+        self._length = 0
+
+    async def write(self, audio_data: bytes):
+        """Buffer audio, sending each frame as it fills"""
+        data = memoryview(audio_data)
+        while data:
+            count = min(len(self._buffer) - self._length, len(data))
+            self._buffer[self._length:self._length + count] = data[:count]
+            self._length += count
+            data = data[count:]
+
+            if self._length == len(self._buffer):
+                await self.flush()
+
+    async def flush(self):
+        """Send any buffered audio as a (possibly short) frame"""
+        if self._length:
+            await self._websocket.send_bytes(self._buffer[:self._length])
+            self._length = 0
 
 
 @app.get("/")
@@ -160,6 +413,138 @@ async def root():
     }
 
 
+async def handle_transcript(websocket: WebSocket, session_id: str, cache: SemanticCache, user_text: str):
+    """
+    Respond to one user utterance, streaming audio as it is synthesized
+
+    Args:
+        websocket: Client connection
+        session_id: WebSocket session ID
+        cache: The user's semantic response cache
+        user_text: What the user said
+    """
+    server = websocket.app.state.server
+
+    # Reuse a cached response for near-identical opening utterances; later
+    # turns depend on the conversation so far and always go to the LLM
+    cached, lookup = None, None
+    if not server.has_history(session_id):
+        lookup = asyncio.create_task(cache.lookup(user_text))
+        done, _ = await asyncio.wait({lookup}, timeout=CACHE_LOOKUP_TIMEOUT)
+        if done:
+            cached, _ = lookup.result()
+
+    if cached:
+        logger.info(f"Assistant response (cached): {cached.response_text}")
+        server.record_turn(session_id, user_text, cached.response_text)
+        await send_message(websocket, {
+            "type": "response",
+            "text": cached.response_text
+        })
+        await send_audio_header(websocket, len(cached.tts_audio_bytes))
+        await send_audio(websocket, cached.tts_audio_bytes)
+        return
+
+    response_text = ""
+    audio_chunks = []
+    failed = False
+
+    # Speech text flows from the LLM to TTS through a queue, so the LLM keeps
+    # streaming the next sentence while the current one is being spoken;
+    # None marks the end of the response
+    speech_queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce_text():
+        nonlocal response_text, failed
+        try:
+            async for chunk in server.stream_response(session_id, user_text):
+                failed = failed or chunk == ERROR_RESPONSE
+                response_text = f"{response_text} {chunk}".strip()
+
+                await send_message(websocket, {
+                    "type": "response",
+                    "text": response_text
+                })
+                speech_queue.put_nowait(chunk)
+        finally:
+            speech_queue.put_nowait(None)
+
+    # Audio length isn't known up front when streaming, so the header
+    # omits it; the client plays frames until the next header
+    await send_audio_header(websocket)
+
+    writer = AudioFrameWriter(websocket)
+    producer = asyncio.create_task(produce_text())
+    try:
+        while (chunk := await speech_queue.get()) is not None:
+            try:
+                async for audio_data in server.stream_speech(chunk):
+                    audio_chunks.append(audio_data)
+                    await writer.write(audio_data)
+            except SpeechSynthesisError:
+                # Keep speaking the rest, but the audio is now incomplete
+                failed = True
+            # Don't hold the end of a sentence back waiting for the next one
+            await writer.flush()
+        await producer
+    finally:
+        producer.cancel()
+
+    logger.info(f"Assistant response: {response_text}")
+
+    # Only cache complete, successful turns
+    if lookup is not None and audio_chunks and not failed:
+        # A lookup that missed the deadline may still have found a match;
+        # storing the utterance again would only add a duplicate row
+        late_hit, embedding = await lookup
+        if late_hit is None and embedding is not None:
+            await cache.store(embedding, response_text, b"".join(audio_chunks))
+
+
+async def send_message(websocket: WebSocket, message: dict):
+    """
+    Send a JSON control message to the client
+
+    Serialized with orjson and sent as a text frame, so binary frames stay
+    reserved for audio.
+
+    Args:
+        websocket: Client connection
+        message: JSON-serializable message
+    """
+    await websocket.send_text(orjson.dumps(message).decode())
+
+
+async def send_audio_header(websocket: WebSocket, num_bytes: Optional[int] = None):
+    """
+    Describe the binary audio frames that follow
+
+    Args:
+        websocket: Client connection
+        num_bytes: Total audio length, if known
+    """
+    header = {
+        "type": "audio_header",
+        "sample_rate": AUDIO_SAMPLE_RATE,
+        "encoding": AUDIO_ENCODING,
+    }
+    if num_bytes is not None:
+        header["bytes"] = num_bytes
+    await send_message(websocket, header)
+
+
+async def send_audio(websocket: WebSocket, audio_data: bytes):
+    """
+    Send synthesized audio to the client as a binary frame
+
+    Args:
+        websocket: Client connection
+        audio_data: Raw PCM audio
+    """
+    if audio_data:
+        await websocket.send_bytes(audio_data)
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -169,17 +554,32 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection accepted")
 
-    session_id = f"session_{int(asyncio.get_event_loop().time() * 1000)}"
+    server = websocket.app.state.server
+    session_id = new_id("session")
+    cache = server.get_cache(websocket.query_params.get("userId", "anonymous"))
 
     try:
         while True:
-            # Receive message from client
-            data = await websocket.receive_text()
+            # Receive message from client; dispatch on frame type so binary
+            # frames never go through text decoding or JSON parsing
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+
+            if frame.get("bytes") is not None:
+                logger.warning(f"Ignoring {len(frame['bytes'])}-byte binary message in session {session_id}")
+                await send_message(websocket, {
+                    "type": "error",
+                    "message": "Binary messages are not supported"
+                })
+                continue
+
+            data = frame.get("text", "")
             logger.info(f"Received text: {data}")
 
             # Parse message
             try:
-                message = json.loads(data)
+                message = orjson.loads(data)
                 msg_type = message.get("type")
 
                 if msg_type == "transcript":
@@ -187,29 +587,11 @@ async def websocket_endpoint(websocket: WebSocket):
                     user_text = message.get("text", "")
                     logger.info(f"User said: {user_text}")
 
-                    # Process through LLM
-                    response_text = await server.process_text(user_text)
-                    logger.info(f"Assistant response: {response_text}")
-
-                    # Send text response first
-                    await websocket.send_json({
-                        "type": "response",
-                        "text": response_text
-                    })
-
-                    # Convert to speech
-                    audio_data = await server.synthesize_speech(response_text)
-
-                    if audio_data:
-                        # Send audio data
-                        await websocket.send_json({
-                            "type": "audio",
-                            "data": audio_data.hex()  # Send as hex string
-                        })
+                    await handle_transcript(websocket, session_id, cache, user_text)
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.error(f"Invalid JSON received: {data}")
-                await websocket.send_json({
+                await send_message(websocket, {
                     "type": "error",
                     "message": "Invalid message format"
                 })
@@ -218,6 +600,8 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.info(f"WebSocket disconnected for session {session_id}")
     except Exception as e:
         logger.error(f"Error in session {session_id}: {e}", exc_info=True)
+    finally:
+        server.end_session(session_id)
 
 
 def main():
@@ -227,12 +611,19 @@ def main():
 
     host = os.getenv("SERVER_HOST", "0.0.0.0")
     port = int(os.getenv("SERVER_PORT", "8000"))
+    workers = int(os.getenv("SERVER_WORKERS", "1"))
 
+    # Conversations live in the worker that accepted the websocket, and the
+    # semantic cache is per worker unless SEMANTIC_CACHE_DIR is shared
     uvicorn.run(
-        app,
+        "simple_server:app",
         host=host,
         port=port,
-        log_level="info"
+        loop="uvloop" if uvloop is not None else "asyncio",
+        http="httptools",
+        ws="websockets",
+        log_level="info",
+        workers=workers
     )
 
 
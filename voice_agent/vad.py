@@ -0,0 +1,208 @@
+"""
+Voice activity detection for the Voice Shopper agent
+Silero VAD running on one shared ONNX Runtime session, with the recurrent
+state kept per audio stream
+"""
+
+import os
+import time
+import logging
+import threading
+from importlib import resources
+from typing import Dict, Optional
+
+import numpy as np
+import onnxruntime
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+from audio_kernels import pcm_view, s16_to_f32
+
+logger = logging.getLogger(__name__)
+
+# Silero v5 expects fixed windows plus a short context carried over from
+# the previous window, per sample rate
+WINDOW_SIZES = {16000: 512, 8000: 256}
+CONTEXT_SIZES = {16000: 64, 8000: 32}
+
+# LSTM state shape: (2, batch, 128)
+STATE_SHAPE = (2, 1, 128)
+
+# Reset recurrent state periodically so long sessions don't drift
+MODEL_RESET_STATES_TIME = 5.0
+
+# Energy gate: frames quieter than ENERGY_GATE_RATIO x the noise floor are
+# treated as silence; the floor is an EMA with this decay per silent frame
+ENERGY_GATE_RATIO = 2.5
+NOISE_FLOOR_DECAY = 0.99
+
+_sessions: Dict[str, onnxruntime.InferenceSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _bundled_model_path() -> str:
+    """Path to the fp32 Silero model shipped with pipecat"""
+    return str(resources.files("pipecat.audio.vad.data").joinpath("silero_vad.onnx"))
+
+
+def get_vad_session(model_path: Optional[str] = None) -> onnxruntime.InferenceSession:
+    """
+    Get the shared ONNX Runtime session for a Silero model
+
+    Sessions are created once per model path and shared by every stream;
+    ONNX Runtime allows concurrent run() calls on one session. Each session
+    is pinned to a single thread so N streams scale across N cores.
+
+    Args:
+        model_path: Path to a Silero VAD ONNX model. Defaults to
+            SILERO_VAD_MODEL_PATH (e.g. an int8-quantized model), then to
+            the model bundled with pipecat.
+
+    Returns:
+        Shared InferenceSession
+    """
+    path = model_path or os.getenv("SILERO_VAD_MODEL_PATH") or _bundled_model_path()
+
+    with _sessions_lock:
+        session = _sessions.get(path)
+        if session is None:
+            logger.info(f"Loading Silero VAD model from {path}")
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = 1
+            options.inter_op_num_threads = 1
+            session = onnxruntime.InferenceSession(
+                path,
+                providers=["CPUExecutionProvider"],
+                sess_options=options,
+            )
+            _sessions[path] = session
+
+    return session
+
+
+class SharedSileroVADAnalyzer(VADAnalyzer):
+    """
+    Silero VAD analyzer backed by a process-wide ONNX session
+
+    Drop-in replacement for pipecat's SileroVADAnalyzer; creating one per
+    connection only allocates the per-stream state, not a model.
+    """
+
+    def __init__(
+        self,
+        *,
+        sample_rate: Optional[int] = None,
+        params: Optional[VADParams] = None,
+        model_path: Optional[str] = None,
+    ):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self._session = get_vad_session(model_path)
+        self._last_reset_time = 0.0
+        self._reset_states()
+
+    def set_sample_rate(self, sample_rate: int):
+        if sample_rate not in WINDOW_SIZES:
+            raise ValueError(f"Silero VAD sample rate needs to be 16000 or 8000 (sample rate: {sample_rate})")
+
+        super().set_sample_rate(sample_rate)
+        self._reset_states()
+
+    def num_frames_required(self) -> int:
+        return WINDOW_SIZES.get(self.sample_rate, WINDOW_SIZES[16000])
+
+    def voice_confidence(self, buffer) -> float:
+        try:
+            self._load_window(buffer)
+            return self._infer()
+
+        except Exception as e:
+            logger.error(f"Error analyzing audio with Silero VAD: {e}")
+            return 0.0
+
+    def _load_window(self, buffer) -> np.ndarray:
+        """
+        Write one window of s16le audio into the model input buffer
+
+        The input buffer is [context | window]; the previous window's tail
+        becomes the new context, and samples are scaled to float32 in
+        place, so no arrays are allocated per frame.
+
+        Args:
+            buffer: Raw audio bytes for one window
+
+        Returns:
+            View of the loaded window
+        """
+        context_size = self._input.shape[1] - self.num_frames_required()
+        self._input[0, :context_size] = self._input[0, -context_size:]
+
+        window = self._input[0, context_size:]
+        s16_to_f32(pcm_view(buffer), window)
+        return window
+
+    def _infer(self) -> float:
+        """Run the model on the loaded input buffer"""
+        out, self._state = self._session.run(
+            None,
+            {"input": self._input, "state": self._state, "sr": self._sr},
+        )
+
+        now = time.time()
+        if now - self._last_reset_time >= MODEL_RESET_STATES_TIME:
+            self._reset_states()
+            self._last_reset_time = now
+
+        return float(out[0][0])
+
+    def _reset_states(self):
+        """Reset the per-stream recurrent state and context"""
+        sample_rate = self.sample_rate if self.sample_rate in WINDOW_SIZES else 16000
+        self._state = np.zeros(STATE_SHAPE, dtype=np.float32)
+        self._input = np.zeros((1, CONTEXT_SIZES[sample_rate] + WINDOW_SIZES[sample_rate]), dtype=np.float32)
+        self._sr = np.array(sample_rate, dtype=np.int64)
+
+
+class EnergyGatedVADAnalyzer(SharedSileroVADAnalyzer):
+    """
+    Silero VAD behind a cheap RMS energy gate
+
+    Frames whose energy is clearly at the background-noise level are
+    reported as silence without invoking the model. The noise floor is an
+    exponential moving average of the RMS of frames judged silent.
+    """
+
+    def __init__(self, *, gate_ratio: float = ENERGY_GATE_RATIO, **kwargs):
+        """
+        Initialize the analyzer
+
+        Args:
+            gate_ratio: Frames below gate_ratio x noise floor skip the model
+            **kwargs: Passed through to SharedSileroVADAnalyzer
+        """
+        super().__init__(**kwargs)
+        self._gate_ratio = gate_ratio
+        self._noise_floor = 0.0
+
+    def voice_confidence(self, buffer) -> float:
+        try:
+            window = self._load_window(buffer)
+            rms = float(np.sqrt(np.dot(window, window) / window.size))
+
+            if rms < self._gate_ratio * self._noise_floor:
+                self._update_noise_floor(rms)
+                return 0.0
+
+            confidence = self._infer()
+            if confidence < self.params.confidence:
+                self._update_noise_floor(rms)
+            return confidence
+
+        except Exception as e:
+            logger.error(f"Error analyzing audio with Silero VAD: {e}")
+            return 0.0
+
+    def _update_noise_floor(self, rms: float):
+        """Fold a silent frame's RMS into the noise floor estimate"""
+        if self._noise_floor:
+            self._noise_floor = NOISE_FLOOR_DECAY * self._noise_floor + (1.0 - NOISE_FLOOR_DECAY) * rms
+        else:
+            self._noise_floor = rms